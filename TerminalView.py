@@ -20,23 +20,19 @@ class TerminalViewManager():
     A manager to control all TerminalView instances so they can be looked up
     based on the sublime view they are governing.
     """
+    term_views = {}
+
     @classmethod
     def register(cls, uid, term_view):
-        if not hasattr(cls, "term_views"):
-            cls.term_views = {}
         cls.term_views[uid] = term_view
 
     @classmethod
     def deregister(cls, uid):
-        if hasattr(cls, "term_views"):
-            del cls.term_views[uid]
+        del cls.term_views[uid]
 
     @classmethod
     def load_from_id(cls, uid):
-        if hasattr(cls, "term_views") and uid in cls.term_views:
-            return cls.term_views[uid]
-        else:
-            return None
+        return cls.term_views.get(uid)
 
 
 class TerminalViewOpen(sublime_plugin.WindowCommand):
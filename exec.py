@@ -12,8 +12,9 @@ class TerminalViewExec(sublime_plugin.WindowCommand):
 
         # Custom environment variables are ignored for now. LinuxPty should be
         # able to handle that in the future.
-        env = kwargs.get("env", {})
-        env = os.environ.copy().update(env)
+        custom_env = kwargs.get("env", {})
+        env = os.environ.copy()
+        env.update(custom_env)
 
         # Get the command that we'll invoke.
         cmd = kwargs.get("cmd", [])
@@ -25,7 +26,7 @@ class TerminalViewExec(sublime_plugin.WindowCommand):
         if not working_dir:
             view = self.window.active_view()
             if view and view.file_name():
-                working_dir = os.path.basedir(view.file_name())
+                working_dir = os.path.dirname(view.file_name())
             else:
                 working_dir = env.get("HOME", "")
                 if not working_dir:
@@ -22,13 +22,9 @@ class GateOneTerminalEmulator():
 
     def dirty_lines(self):
         if not self._modified:
-            return {}
+            return []
 
-        i = 0
-        dirty_lines = {}
-        for line in self._term.dump():
-            dirty_lines[i] = line
-            i = i + 1
+        dirty_lines = list(enumerate(self._term.dump()))
 
         # convert_go_renditions_to_colormap(self._term.renditions, self._term.renditions_store, [])
         return dirty_lines
@@ -44,16 +44,19 @@ class PyteTerminalEmulator():
         self._modified = True
 
     def dirty_lines(self):
-        dirty_lines = {}
-        nb_dirty_lines = len(self._screen.dirty)
-        if nb_dirty_lines > 0:
+        """
+        Get the dirty lines as a list of (line number, content) tuples sorted by
+        line number
+        """
+        dirty_lines = []
+        if self._screen.dirty:
             display = self._screen.display
-            for line in self._screen.dirty:
-                if line >= len(display):
+            nb_display_lines = len(display)
+            for line in sorted(self._screen.dirty):
+                if line >= nb_display_lines:
                     # This happens when screen is resized smaller
                     break
-                else:
-                    dirty_lines[line] = display[line]
+                dirty_lines.append((line, display[line]))
 
         return dirty_lines
 
@@ -115,10 +118,31 @@ class CustomHistoryScreen(pyte.DiffScreen):
 
     def scroll_to_bottom(self):
         """
-        Ensure a screen is at the bottom of the history buffer
+        Ensure a screen is at the bottom of the history buffer. This has the
+        same result as calling next_page until the bottom is reached but moves
+        all the lines in one go instead of a page at a time.
         """
-        while self.history.position < self.history.size:
-            self.next_page()
+        position = self.history.position
+        size = self.history.size
+        if position >= size:
+            return
+
+        # Number of pages next_page would move down and the number of lines it
+        # would take from the bottom history while doing so
+        nb_pages = int(math.ceil((size - position) / self.lines))
+        mid = int(math.ceil(self.lines * self.history.ratio))
+        nb_lines = min(len(self.history.bottom), nb_pages * mid)
+
+        if nb_lines > 0:
+            lines = self.buffer + [
+                self.history.bottom.popleft() for _ in range(nb_lines)
+            ]
+            self.history.top.extend(lines[:nb_lines])
+            self.buffer[:] = lines[nb_lines:]
+            self.dirty = set(range(self.lines))
+
+        self.history = self.history \
+            ._replace(position=position + nb_pages * self.lines)
 
     def ensure_screen_width(self):
         """
@@ -288,6 +312,7 @@ def convert_pyte_buffer_to_colormap(buffer, lines):
     Convert a pyte buffer to a simple colors
     """
     color_map = {}
+    default_color = ("black", "white")
     for line_index in lines:
         # There may be lines outside the buffer after terminal was resized.
         # These are considered blank.
@@ -298,40 +323,26 @@ def convert_pyte_buffer_to_colormap(buffer, lines):
         # continuous fields with same color we want to combine them for
         # optimization and because it looks better when rendered in ST3.
         line = buffer[line_index]
-        line_len = len(line)
-        if line_len == 0:
+        if len(line) == 0:
             continue
 
-        # Initialize vars to keep track of continuous colors
-        last_bg = line[0].bg
-        if last_bg == "default":
-            last_bg = "black"
-
-        last_fg = line[0].fg
-        if last_fg == "default":
-            last_fg = "white"
-
-        if line[0].reverse:
-            last_color = (last_fg, last_bg)
-        else:
-            last_color = (last_bg, last_fg)
-
+        # Fields are collected as (index, color, length) tuples and only turned
+        # into the color map format once the line has been processed
+        fields = []
+        last_color = None
         last_index = 0
         field_length = 0
 
         char_index = 0
         for char in line:
-            # Default bg is black
-            if char.bg is "default":
+            # Default bg is black and default fg is white
+            bg = char.bg
+            if bg == "default":
                 bg = "black"
-            else:
-                bg = char.bg
 
-            # Default fg is white
-            if char.fg is "default":
+            fg = char.fg
+            if fg == "default":
                 fg = "white"
-            else:
-                fg = char.fg
 
             if char.reverse:
                 color = (fg, bg)
@@ -341,23 +352,23 @@ def convert_pyte_buffer_to_colormap(buffer, lines):
             if last_color == color:
                 field_length = field_length + 1
             else:
-                color_dict = {"color": last_color, "field_length": field_length}
-
-                if last_color != ("black", "white"):
-                    if line_index not in color_map:
-                        color_map[line_index] = {}
-                    color_map[line_index][last_index] = color_dict
+                if field_length > 0 and last_color != default_color:
+                    fields.append((last_index, last_color, field_length))
 
                 last_color = color
                 last_index = char_index
                 field_length = 1
 
-            # Check if last color was active to the end of screen
-            if last_color != ("black", "white"):
-                color_dict = {"color": last_color, "field_length": field_length}
-                if line_index not in color_map:
-                    color_map[line_index] = {}
-                color_map[line_index][last_index] = color_dict
-
             char_index = char_index + 1
+
+        # Check if last color was active to the end of screen
+        if last_color != default_color:
+            fields.append((last_index, last_color, field_length))
+
+        if fields:
+            color_map[line_index] = {
+                idx: {"color": color, "field_length": length}
+                for idx, color, length in fields
+            }
+
     return color_map
@@ -1,7 +1,7 @@
 """
 Wrapper module around a Sublime Text 3 view for showing a terminal look-a-like
 """
-import collections
+import functools
 import time
 
 import sublime
@@ -12,28 +12,38 @@ from . import pyte_terminal_emulator
 from . import utils
 from . import sublime_view_cache
 
+# Default modifiers for keypresses where they are not given
+_KEYPRESS_DEFAULTS = {"meta": False, "alt": False, "ctrl": False, "shift": False}
+
+# Scope names for all (bg, fg) color combinations in the color map. These match
+# the scopes in the TerminalView color scheme and are generated once here to
+# avoid formatting them on every update.
+_COLORS = ("black", "red", "green", "brown", "blue", "magenta", "cyan", "white")
+_COLOR_SCOPES = {
+    (bg, fg): "terminalview.%s_%s" % (bg, fg) for bg in _COLORS for fg in _COLORS
+}
+
 
 class SublimeBufferManager():
     """
     A manager to control all SublimeBuffer instances so they can be looked up
     based on the sublime view they are governing.
     """
+    buffers = {}
+
     @classmethod
     def register(cls, uid, sublime_buffer):
-        if not hasattr(cls, "buffers"):
-            cls.buffers = {}
         cls.buffers[uid] = sublime_buffer
 
     @classmethod
     def deregister(cls, uid):
-        if hasattr(cls, "buffers"):
-            del cls.buffers[uid]
+        del cls.buffers[uid]
 
     @classmethod
     def load_from_id(cls, uid):
-        if hasattr(cls, "buffers") and uid in cls.buffers:
+        try:
             return cls.buffers[uid]
-        else:
+        except KeyError:
             raise Exception("[terminal_view error] Sublime buffer not found")
 
 
@@ -73,6 +83,7 @@ class SublimeTerminalBuffer():
         self._term_emulator = pyte_terminal_emulator.PyteTerminalEmulator(80, 24, hist, ratio)
 
         self._keypress_callback = None
+        self._scroll_request = None
         self._view_content_cache = sublime_view_cache.SublimeViewContentCache()
         self._view_region_cache = sublime_view_cache.SublimeViewRegionCache()
 
@@ -107,9 +118,12 @@ class SublimeTerminalBuffer():
         t = time.time() - start
         utils.ConsoleLogger.log("Updated terminal emulator in %.3f ms" % (t * 1000.))
 
+    def request_scroll(self, scroll_request):
+        self._scroll_request = scroll_request
+
     def update_view(self):
         self._scroll_terminal_if_requested()
-        if self.terminal_emulator().modified():
+        if self._term_emulator.modified():
             self._view.run_command("terminal_view_update")
 
     def is_open(self):
@@ -155,8 +169,12 @@ class SublimeTerminalBuffer():
         return (nb_rows, nb_columns)
 
     def _scroll_terminal_if_requested(self):
-        scroll_request = self._view.settings().get("terminal_view_scroll", None)
+        # Scroll requests are kept on the instance rather than in the view
+        # settings as this is polled on every update, even when idle
+        scroll_request = self._scroll_request
         if scroll_request is not None:
+            self._scroll_request = None
+
             index = scroll_request[0]
             direction = scroll_request[1]
             if index == "line":
@@ -170,13 +188,11 @@ class SublimeTerminalBuffer():
                 else:
                     self.terminal_emulator().next_page()
 
-            self._view.settings().set("terminal_view_scroll", None)
-
 
 class TerminalViewScroll(sublime_plugin.TextCommand):
     def run(self, _, forward=False, line=False):
-        # Mark in view to request a scroll in the thread that handles the
-        # updates. Note lines are NOT supported at the moment.
+        # Request a scroll in the thread that handles the updates. Note lines
+        # are NOT supported at the moment.
         if line:
             scroll_request = ("line", )
         else:
@@ -187,7 +203,8 @@ class TerminalViewScroll(sublime_plugin.TextCommand):
         else:
             scroll_request = scroll_request + ("down", )
 
-        self.view.settings().set("terminal_view_scroll", scroll_request)
+        sub_buffer = SublimeBufferManager.load_from_id(self.view.id())
+        sub_buffer.request_scroll(scroll_request)
 
 
 class TerminalViewKeypress(sublime_plugin.TextCommand):
@@ -205,26 +222,18 @@ class TerminalViewKeypress(sublime_plugin.TextCommand):
             sublime.error_message("Terminal View: Got keypress with non-string key")
             return
 
-        if "meta" in kwargs and kwargs["meta"]:
+        keypress = dict(_KEYPRESS_DEFAULTS)
+        keypress.update(kwargs)
+
+        if keypress["meta"]:
             sublime.error_message("Terminal View: Meta key is not supported yet")
             return
 
-        if "meta" not in kwargs:
-            kwargs["meta"] = False
-        if "alt" not in kwargs:
-            kwargs["alt"] = False
-        if "ctrl" not in kwargs:
-            kwargs["ctrl"] = False
-        if "shift" not in kwargs:
-            kwargs["shift"] = False
-
-        # Lookup the sublime buffer instance for this view
-        sublime_buffer = SublimeBufferManager.load_from_id(self.view.id())
-        keypress_cb = sublime_buffer.keypress_callback()
-        app_mode = sublime_buffer.terminal_emulator().application_mode_enabled()
+        keypress_cb = self._sub_buffer.keypress_callback()
+        app_mode = self._sub_buffer.terminal_emulator().application_mode_enabled()
         if keypress_cb:
-            keypress_cb(kwargs["key"], kwargs["ctrl"], kwargs["alt"],
-                        kwargs["shift"], kwargs["meta"], app_mode)
+            keypress_cb(keypress["key"], keypress["ctrl"], keypress["alt"],
+                        keypress["shift"], keypress["meta"], app_mode)
 
 
 class TerminalViewCopy(sublime_plugin.TextCommand):
@@ -238,11 +247,9 @@ class TerminalViewCopy(sublime_plugin.TextCommand):
         # Clean the selected text and move it into clipboard
         selected_text = self.view.substr(selected_region)
         selected_lines = selected_text.split("\n")
-        clean_contents_to_copy = ""
-        for line in selected_lines:
-            clean_contents_to_copy = clean_contents_to_copy + line.rstrip() + "\n"
+        clean_contents_to_copy = "\n".join(line.rstrip() for line in selected_lines)
 
-        sublime.set_clipboard(clean_contents_to_copy[:-1])
+        sublime.set_clipboard(clean_contents_to_copy)
 
 
 class TerminalViewPaste(sublime_plugin.TextCommand):
@@ -296,6 +303,11 @@ class TerminalViewUpdate(sublime_plugin.TextCommand):
     def __init__(self, view):
         super().__init__(view)
         self._sub_buffer = None
+        self._settings = view.settings()
+
+        # Local copy of the cursor position stored in the view settings so we
+        # do not have to go through the settings on every update
+        self._last_cursor_pos = None
 
     def run(self, edit):
         # Lookup the sublime buffer instance for this view the first time this
@@ -303,19 +315,26 @@ class TerminalViewUpdate(sublime_plugin.TextCommand):
         if self._sub_buffer is None:
             self._sub_buffer = SublimeBufferManager.load_from_id(self.view.id())
 
+        # Nothing to do if the terminal emulator has not been modified since the
+        # last update, e.g. if the command is run outside the update loop
+        term_emulator = self._sub_buffer.terminal_emulator()
+        if not term_emulator.modified():
+            return
+
         # Update dirty lines in buffer if there are any
-        dirty_lines = self._sub_buffer.terminal_emulator().dirty_lines()
+        dirty_lines = term_emulator.dirty_lines()
         if len(dirty_lines) > 0:
             self._update_viewport_position()
 
             # Invalidate the last cursor position when dirty lines are updated
-            self.view.settings().set("terminal_view_last_cursor_pos", None)
+            self._last_cursor_pos = None
 
             # Generate color map
             color_map = {}
             if self._sub_buffer.colors_enabled():
                 start = time.time()
-                color_map = self._sub_buffer.terminal_emulator().color_map(dirty_lines.keys())
+                lines = [line_no for line_no, _ in dirty_lines]
+                color_map = term_emulator.color_map(lines)
                 t = time.time() - start
                 utils.ConsoleLogger.log("Generated color map in %.3f ms" % (t * 1000.))
 
@@ -331,45 +350,51 @@ class TerminalViewUpdate(sublime_plugin.TextCommand):
         self._update_cursor()
 
         # Clear dirty lines (and modified flag)
-        self._sub_buffer.terminal_emulator().clear_dirty()
+        term_emulator.clear_dirty()
 
     def _update_viewport_position(self):
         self.view.set_viewport_position((0, 0), animate=False)
 
     def _update_cursor(self):
         cursor_pos = self._sub_buffer.terminal_emulator().cursor()
-        last_cursor_pos = self.view.settings().get("terminal_view_last_cursor_pos")
-        if last_cursor_pos and last_cursor_pos[0] == cursor_pos[0] and last_cursor_pos[1] == cursor_pos[1]:
+        if self._last_cursor_pos == cursor_pos:
             return
 
         tp = self.view.text_point(cursor_pos[0], cursor_pos[1])
         self.view.sel().clear()
         self.view.sel().add(sublime.Region(tp, tp))
-        self.view.settings().set("terminal_view_last_cursor_pos", cursor_pos)
+
+        # The position is also stored in the view settings since it is used as
+        # context in the keymap
+        self._last_cursor_pos = cursor_pos
+        self._settings.set("terminal_view_last_cursor_pos", cursor_pos)
 
     def _update_lines(self, edit, dirty_lines, color_map):
-        self.view.set_read_only(False)
-        lines = dirty_lines.keys()
-        for line_no in sorted(lines):
-            # Clear any colors on the line
-            self._remove_color_regions_on_line(line_no)
+        # Colors are fixed for the lifetime of the buffer so if they are
+        # disabled there can be no color regions to update or clear
+        colors_enabled = self._sub_buffer.colors_enabled()
 
+        self.view.set_read_only(False)
+        for line_no, content in dirty_lines:
             # Update the line
-            self._update_line_content(edit, line_no, dirty_lines[line_no])
+            self._update_line_content(edit, line_no, content)
 
-            # Apply colors to the line if there are any on it
-            if line_no in color_map:
-                self._update_line_colors(line_no, color_map[line_no])
+            # Update the colors on the line (this also clears any old colors)
+            if colors_enabled:
+                self._update_line_colors(line_no, color_map.get(line_no))
 
         self.view.set_read_only(True)
 
-    def _remove_color_regions_on_line(self, line_no):
-        view_region_cache = self._sub_buffer.view_region_cache()
-        if view_region_cache.has_line(line_no):
-            region_keys = view_region_cache.get_line(line_no)
+    def _remove_color_regions_on_line(self, line_no, keep=()):
+        region_keys = self._sub_buffer.view_region_cache().get_line(line_no)
+        if region_keys:
             for key in region_keys:
-                self.view.erase_regions(key)
-            view_region_cache.delete_line(line_no)
+                if key not in keep:
+                    self.view.erase_regions(key)
+
+            # Clear the list in place so it can be reused when the line gets new
+            # regions
+            region_keys.clear()
 
     def _update_line_content(self, edit, line_no, content):
         # Note this function has been optimized quite a bit. Calls to the ST3
@@ -402,21 +427,35 @@ class TerminalViewUpdate(sublime_plugin.TextCommand):
         view_region_cache = self._sub_buffer.view_region_cache()
         view_content_cache = self._sub_buffer.view_content_cache()
 
-        for idx, field in line_color_map.items():
-            length = field["field_length"]
-            color_scope = "terminalview.%s_%s" % (field["color"][0], field["color"][1])
-
-            # Get text point where color should start
+        # Group the regions that should be colored by scope so each scope only
+        # needs a single call to add_regions
+        scope_regions = {}
+        if line_color_map:
+            # Get text point where the line starts - it is the same for all
+            # fields
             line_start, _ = view_content_cache.get_line_start_and_end_points(line_no)
-            color_start = line_start + idx
 
-            # Make region that should be colored
-            buffer_region = sublime.Region(color_start, color_start + length)
-            region_key = "%i,%s" % (line_no, idx)
-
-            # Add the region
-            flags = sublime.DRAW_NO_OUTLINE | sublime.PERSISTENT
-            self.view.add_regions(region_key, [buffer_region], color_scope, flags=flags)
+            for idx, field in line_color_map.items():
+                length = field["field_length"]
+                color_scope = _COLOR_SCOPES[field["color"]]
+
+                # Make region that should be colored
+                color_start = line_start + idx
+                buffer_region = sublime.Region(color_start, color_start + length)
+                scope_regions.setdefault(color_scope, []).append(buffer_region)
+
+        # The region keys are stable for a scope on a line and add_regions
+        # replaces regions with the same key, so only keys that are no longer
+        # used on the line have to be erased
+        line_key = "%i," % line_no
+        region_keys = {scope: line_key + scope for scope in scope_regions}
+        self._remove_color_regions_on_line(line_no, keep=region_keys.values())
+
+        # Add the regions
+        flags = sublime.DRAW_NO_OUTLINE | sublime.PERSISTENT
+        for color_scope, regions in scope_regions.items():
+            region_key = region_keys[color_scope]
+            self.view.add_regions(region_key, regions, color_scope, flags=flags)
             view_region_cache.add(line_no, region_key)
 
 
@@ -435,6 +474,17 @@ def set_color_scheme(view):
     """
     Set color scheme for view
     """
+    color_scheme = _resolve_color_scheme()
+    if view.settings().get('color_scheme') != color_scheme:
+        view.settings().set('color_scheme', color_scheme)
+
+
+@functools.lru_cache(maxsize=1)
+def _resolve_color_scheme():
+    """
+    Get the color scheme to use for terminal views. The result is cached to
+    avoid loading the resource every time the color scheme setting changes.
+    """
     color_scheme = "Packages/TerminalView/TerminalView.hidden-tmTheme"
 
     # Check if user color scheme exists
@@ -444,5 +494,9 @@ def set_color_scheme(view):
     except:
         pass
 
-    if view.settings().get('color_scheme') != color_scheme:
-        view.settings().set('color_scheme', color_scheme)
+    return color_scheme
+
+
+def plugin_loaded():
+    # Make sure a user color scheme installed since the last load is picked up
+    _resolve_color_scheme.cache_clear()
@@ -12,12 +12,21 @@ class SublimeViewContentCache():
     def __init__(self):
         self._buffer_contents = {}
 
+        # Cumulative start points of the lines in the buffer, i.e. the start
+        # point of line n is at index n. The list is extended lazily when start
+        # points are requested and truncated when a line changes length.
+        self._line_offsets = [0]
+
     def update_line(self, line_no, content):
+        old_content = self._buffer_contents.get(line_no)
         self._buffer_contents[line_no] = content
+        if old_content is None or len(old_content) != len(content):
+            self._invalidate_offsets(line_no)
 
     def delete_line(self, line_no):
         if line_no in self._buffer_contents:
             del self._buffer_contents[line_no]
+            self._invalidate_offsets(line_no)
 
     def get_line(self, line_no):
         if line_no in self._buffer_contents:
@@ -28,21 +37,21 @@ class SublimeViewContentCache():
         return line_no in self._buffer_contents
 
     def get_line_start_and_end_points(self, line_no):
-        start_point = 0
-
-        # Sum all lines leading up to the line we want the start point to
-        for i in range(line_no):
-            if i in self._buffer_contents:
-                line_len = len(self._buffer_contents[i])
-                start_point = start_point + line_len
+        # Extend the cumulative offsets until both the start point of the line
+        # and the start point of the following line (our end point) are known
+        line_offsets = self._line_offsets
+        buffer_contents = self._buffer_contents
+        for i in range(len(line_offsets) - 1, line_no + 1):
+            line_len = 0
+            if i in buffer_contents:
+                line_len = len(buffer_contents[i])
+            line_offsets.append(line_offsets[i] + line_len)
 
-        # Add length of line to the end_point
-        end_point = start_point
-        if line_no in self._buffer_contents:
-            line_len = len(self._buffer_contents[line_no])
-            end_point = end_point + line_len
+        return (line_offsets[line_no], line_offsets[line_no + 1])
 
-        return (start_point, end_point)
+    def _invalidate_offsets(self, line_no):
+        # The start point of the line itself is unaffected by its length
+        del self._line_offsets[line_no + 1:]
 
 
 class SublimeViewRegionCache():
@@ -55,19 +64,13 @@ class SublimeViewRegionCache():
         self._buffer_regions = {}
 
     def add(self, line_no, key):
-        if line_no in self._buffer_regions:
-            self._buffer_regions[line_no].append(key)
-        else:
-            self._buffer_regions[line_no] = [key]
+        self._buffer_regions.setdefault(line_no, []).append(key)
 
     def get_line(self, line_no):
-        if line_no in self._buffer_regions:
-            return self._buffer_regions[line_no]
-        return None
+        return self._buffer_regions.get(line_no)
 
     def delete_line(self, line_no):
-        if line_no in self._buffer_regions:
-            del self._buffer_regions[line_no]
+        self._buffer_regions.pop(line_no, None)
 
     def has_line(self, line_no):
         return line_no in self._buffer_regions
@@ -25,9 +25,9 @@ class line_updates(unittest.TestCase):
             self._expected_buffer_contents.append("           \n")
 
         # Update lines 0 to 5 with blanks as we should under normal operation
-        lines = {}
+        lines = []
         for i in range(5):
-            lines[i] = " " * 11
+            lines.append((i, " " * 11))
         self._sublime_cmd._update_lines(None, lines, {})
 
         # Check that local copy of buffer is correct
@@ -45,10 +45,10 @@ class line_updates(unittest.TestCase):
 
     def test_line_insert(self):
         # Update lines 1 and 3 with new content
-        lines = {
-            0: "test line 1",
-            2: "line 2     ",
-        }
+        lines = [
+            (0, "test line 1"),
+            (2, "line 2     "),
+        ]
 
         self._expected_buffer_contents[0] = "test line 1\n"
         self._expected_buffer_contents[2] = "line 2     \n"
@@ -69,6 +69,25 @@ class line_updates(unittest.TestCase):
         self.assertEqual(replaces[1].content, self._expected_buffer_contents[2])
         self._test_view.clear_replace_calls()
 
+    def test_line_length_change(self):
+        # Shorten line 1 - the start points of the following lines must move
+        lines = [(1, "short")]
+        self._sublime_cmd._update_lines(None, lines, {})
+
+        lines = [(3, "line 3     ")]
+        self._sublime_cmd._update_lines(None, lines, {})
+
+        buffer_cache = self._sub_buffer.view_content_cache()
+        self.assertEqual(buffer_cache.get_line_start_and_end_points(1), (12, 18))
+        self.assertEqual(buffer_cache.get_line_start_and_end_points(3), (30, 42))
+
+        replaces = self._test_view.get_replace_calls()
+        self.assertEqual(replaces[0].region.a, 12)
+        self.assertEqual(replaces[0].region.b, 24)
+        self.assertEqual(replaces[1].region.a, 30)
+        self.assertEqual(replaces[1].region.b, 42)
+        self._test_view.clear_replace_calls()
+
 
 class terminal_buffer(unittest.TestCase):
     def test_view_size(self):
@@ -47,6 +47,35 @@ class terminal_resize(unittest.TestCase):
             self.assertEqual(display[i], lines[i+1].ljust(nb_cols))
 
 
+class history_scroll(unittest.TestCase):
+    def _make_screen(self, nb_scrolls):
+        screen = pyte_terminal_emulator.CustomHistoryScreen(20, 6, 200, 0.5)
+        stream = pyte_terminal_emulator.pyte.ByteStream()
+        stream.attach(screen)
+        for i in range(40):
+            stream.feed(("line %i\r\n" % i).encode("utf8"))
+
+        for _ in range(nb_scrolls):
+            screen.prev_page()
+
+        return screen
+
+    def test_scroll_to_bottom(self):
+        for nb_scrolls in range(8):
+            # Scroll back down page by page to get the expected result
+            expected = self._make_screen(nb_scrolls)
+            while expected.history.position < expected.history.size:
+                expected.next_page()
+
+            screen = self._make_screen(nb_scrolls)
+            screen.scroll_to_bottom()
+
+            self.assertEqual(screen.display, expected.display)
+            self.assertEqual(screen.history.position, expected.history.position)
+            self.assertEqual(list(screen.history.top), list(expected.history.top))
+            self.assertEqual(list(screen.history.bottom), list(expected.history.bottom))
+
+
 class pyte_buffer_to_color_map(unittest.TestCase):
     def test_no_colors(self):
         buffer_factory = PyteBufferStubFactory(14, 37)